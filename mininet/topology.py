@@ -10,9 +10,21 @@ from mininet.node import OVSSwitch # <-- Kept OVSSwitch
 from mininet.cli import CLI
 from mininet.log import setLogLevel, info
 from mininet.link import TCLink
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
 import time
 
 
+HTTP_BASE_PORT = 8000
+IPERF_BASE_PORT = 5000
+
+# TCP window for iperf, sized above the bandwidth-delay product of the
+# fastest host path (100 Mbit/s * ~20 ms RTT / 8 = ~250 KB) so the test
+# reaches line rate without waiting on window growth
+IPERF_WINDOW = '256K'
+
+
 def create_topology():
     info('*** Creating network\n')
     net = Mininet(
@@ -50,33 +62,60 @@ def create_topology():
     return net
 
 
+def install_packages():
+    """Install snmpd and traffic generator tools once on the host OS"""
+    # Mininet hosts share the root filesystem, so one install serves them all
+    info('*** Installing tools (snmpd, curl, iperf, busybox)...\n')
+    # Only refresh the package lists if they are over an hour old
+    try:
+        stale = time.time() - os.path.getmtime('/var/cache/apt/pkgcache.bin') > 3600
+    except OSError:
+        stale = True
+    # Non-interactive apt skips progress rendering and never stops at the
+    # snmpd postinst configuration prompts
+    env = dict(os.environ, DEBIAN_FRONTEND='noninteractive')
+    apt_get = ['apt-get', '-o', 'Dpkg::Use-Pty=0',
+               '-o', 'Dpkg::Options::=--force-confdef',
+               '-o', 'Dpkg::Options::=--force-confold']
+    if stale:
+        # An offline VM or a mirror hiccup should not stop the lab when the
+        # tools are already installed; install below still fails if not
+        if subprocess.run(apt_get + ['update', '-qq'], env=env).returncode != 0:
+            info('*** Warning: apt-get update failed, using cached package lists\n')
+    subprocess.run(apt_get + ['install', '-y', '-qq', '--no-install-recommends',
+                              'snmpd', 'curl', 'iperf', 'busybox'], env=env, check=True)
+
+
 def setup_snmp_agents(net):
     """Setup SNMP agents on hosts, as per the troubleshooting guide"""
     info('*** Setting up SNMP agents on all hosts...\n')
     
-    for host in net.hosts:
-        info(f'Configuring SNMP on {host.name} ({host.IP()})...\n')
-        host.cmd('apt-get update -qq > /dev/null 2>&1')
-
-        # Install snmpd AND the tools needed by the traffic generator
-        info(f'Installing tools (snmpd, curl, iperf) on {host.name}...\n')
-        host.cmd('apt-get install -y -qq snmpd curl iperf > /dev/null 2>&1')
-        
-        # Configure snmpd.conf to listen on all interfaces (0.0.0.0)
-        conf = """
+    # Configure snmpd.conf to listen on all interfaces (0.0.0.0). Hosts
+    # share the root filesystem, so the file is written once for all of
+    # them rather than rewritten (and raced on) by every host
+    conf = """
 agentAddress udp:161
 rocommunity public
 sysLocation "Mininet Lab"
 sysContact "admin@project.local"
         """
-        # Use 'echo' to write the file, ensuring correct permissions
-        host.cmd(f"echo '{conf}' > /etc/snmp/snmpd.conf")
+    with open('/etc/snmp/snmpd.conf', 'w') as f:
+        f.write(conf)
+    
+    def _configure_host(host):
+        info(f'Configuring SNMP on {host.name} ({host.IP()})...\n')
         
-        # Restart the service to apply changes
-        host.cmd('service snmpd restart')
+        # Start snmpd directly inside the host's namespace; going through
+        # the init system is slow and not namespace-aware anyway
+        host.cmd(f'snmpd -C -c /etc/snmp/snmpd.conf -Lf /tmp/snmpd-{host.name}.log &')
                 
         info(f'SNMP agent started on {host.name}\n')
 
+    # Each host has its own shell, so the setup can run on all hosts at
+    # once instead of one after another
+    with ThreadPoolExecutor(max_workers=len(net.hosts)) as executor:
+        list(executor.map(_configure_host, net.hosts))
+
 
 def run_tests(net):
     """Run basic connectivity tests"""
@@ -94,54 +133,85 @@ def run_tests(net):
     result = h1.cmd(f'ping -c 3 {h6.IP()}')
     info(result)
     
-    # Bandwidth test using iperf
+    # Bandwidth test against the iperf server started by start_monitoring
     info('*** Bandwidth test: h1 -> h2\n')
-    h2.cmd('iperf -s &')
-    time.sleep(1)
-    result = h1.cmd(f'iperf -c {h2.IP()} -t 5')
+    port = IPERF_BASE_PORT + net.hosts.index(h2) + 1
+    result = h1.cmd(f'iperf -c {h2.IP()} -p {port} -w {IPERF_WINDOW} -t 2')
     info(result)
-    h2.cmd('kill %iperf')
 
 
 def start_monitoring(net):
     """Start monitoring services on hosts"""
     info('*** Starting monitoring services\n')
     
-    # Start simple HTTP servers for testing
-    for i, host in enumerate(net.hosts, 1):
-        port = 8000 + i
-        host.cmd(f'python3 -m http.server {port} &')
+    # Start simple HTTP servers and persistent iperf servers for testing
+    def _start_services(i, host):
+        port = HTTP_BASE_PORT + i
+        iperf_port = IPERF_BASE_PORT + i
+        # One shell round-trip per host for both servers. busybox httpd is a
+        # fraction of the size of a Python http.server per host
+        host.cmd(f'busybox httpd -f -p {port} -h /tmp > /dev/null 2>&1 & '
+                 f'iperf -s -p {iperf_port} -w {IPERF_WINDOW} -D')
         info(f'HTTP server started on {host.name}:{port}\n')
+        info(f'iperf server started on {host.name}:{iperf_port}\n')
+        
+    with ThreadPoolExecutor(max_workers=len(net.hosts)) as executor:
+        list(executor.map(_start_services, range(1, len(net.hosts) + 1), net.hosts))
+
+
+def stop_monitoring(net):
+    """Stop the services started by setup_snmp_agents and start_monitoring"""
+    info('*** Stopping monitoring services\n')
+    
+    # snmpd and iperf -D daemonize out of the host shell's process group, so
+    # net.stop() would leave them (and their namespaces) running. Hosts
+    # share one PID namespace, so each pattern names that host's own port
+    # or log file
+    def _stop_services(i, host):
+        port = HTTP_BASE_PORT + i
+        iperf_port = IPERF_BASE_PORT + i
+        host.cmd(f"pkill -f 'busybox httpd -f -p {port} '; "
+                 f"pkill -f 'iperf -s -p {iperf_port} -w'; "
+                 f"pkill -f 'snmpd -C .*/tmp/snmpd-{host.name}.log'")
+        
+    with ThreadPoolExecutor(max_workers=len(net.hosts)) as executor:
+        list(executor.map(_stop_services, range(1, len(net.hosts) + 1), net.hosts))
 
 
 def main():
     """Main function"""
     setLogLevel('info')
     
-    net = create_topology()
-
+    # Install before the network exists, so a failed install leaves
+    # nothing behind to clean up
     info('*** Automating SNMP setup as per troubleshooting plan...\n')
-    setup_snmp_agents(net)
-    
-    # Run connectivity tests
-    run_tests(net)
-    
-    # Start monitoring services
-    start_monitoring(net)
-    
-    info('*** Network is ready!\n')
-    info('*** You can now:\n')
-    info('    1. Run traffic generator: python mininet/traffic_generator.py\n')
-    info('    2. Access Grafana: http://localhost:3000\n')
-    info('    3. Access Prometheus: http://localhost:9090\n')
-    info('*** Starting CLI (type "exit" to quit)\n')
+    install_packages()
     
-    # Start CLI
-    CLI(net)
-    
-    # Cleanup
-    info('*** Stopping network\n')
-    net.stop()
+    net = create_topology()
+
+    try:
+        setup_snmp_agents(net)
+        
+        # Start monitoring services (run_tests relies on their iperf servers)
+        start_monitoring(net)
+        
+        # Run connectivity tests
+        run_tests(net)
+        
+        info('*** Network is ready!\n')
+        info('*** You can now:\n')
+        info('    1. Run traffic generator: python mininet/traffic_generator.py\n')
+        info('    2. Access Grafana: http://localhost:3000\n')
+        info('    3. Access Prometheus: http://localhost:9090\n')
+        info('*** Starting CLI (type "exit" to quit)\n')
+        
+        # Start CLI
+        CLI(net)
+    finally:
+        # Cleanup
+        stop_monitoring(net)
+        info('*** Stopping network\n')
+        net.stop()
 
 
 if __name__ == '__main__':
@@ -4,12 +4,58 @@ Network Traffic Generator
 Generates various types of network traffic for testing monitoring systems
 """
 
+import os
 import time
+import re
 import random
+import select
+import signal
+import socket
+import struct
+import asyncio
+import itertools
 import subprocess
-import threading
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Tuple
+
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# Round-trip summary line of ping(8), e.g. "min/avg/max/mdev = 0.04/0.05/0.06/0.01 ms"
+_PING_STATS_RE = re.compile(rb'min/avg/max[/\w]*\s*=\s*[\d./]+\s*ms')
+
+# Mixed traffic draws its random choices in batches of this many probes
+SCHEDULE_SIZE = 10_000
+TRAFFIC_TYPES = ('ping', 'http', 'udp')
+
+# Minimum time between the starts of two burst rounds to the same target
+BURST_ROUND_INTERVAL = 2.0
+
+
+# (epoch second, formatted "%H:%M:%S") of the last log timestamp
+_ts_cache = (0, '')
+
+
+def _ts() -> str:
+    """Return the current time as HH:MM:SS, formatting at most once per second"""
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, time.strftime('%H:%M:%S', time.localtime(now)))
+    return _ts_cache[1]
+
+
+def _icmp_checksum(data: bytes) -> int:
+    """Compute the RFC 1071 internet checksum of an ICMP packet"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
 
 
 class TrafficGenerator:
@@ -29,66 +75,168 @@ class TrafficGenerator:
             self.targets = targets
             
         self.running = False
+        self._rng = random.Random()
+        self._schedule_pos = SCHEDULE_SIZE
+        
+        # Reused for every UDP datagram instead of forking a tool per packet
+        self._udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 256 * 1024)
+        
+        # Ping in-process over an ICMP socket when we are allowed to open
+        # one, otherwise fall back to forking the ping binary
+        self._icmp_type = self._icmp_socket_type()
+        self._icmp_ids = itertools.count(self._rng.randint(0, 0xFFFF))
+        
+    @staticmethod
+    def _icmp_socket_type():
+        """Return the usable ICMP socket type (raw or unprivileged), or None"""
+        for sock_type in (socket.SOCK_RAW, socket.SOCK_DGRAM):
+            try:
+                socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP).close()
+                return sock_type
+            except OSError:
+                continue
+        return None
+        
+    def _icmp_ping(self, targets: List[str], count: int,
+                   timeout: float = 2.0) -> Dict[str, List[float]]:
+        """
+        Send ICMP echo requests to all targets back-to-back and collect replies
+        
+        Args:
+            targets: Target IP addresses or hostnames
+            count: Number of echo requests per target
+            timeout: Seconds to wait for outstanding replies
+            
+        Returns:
+            Dictionary mapping each target to its round-trip times in ms
+        """
+        rtts = {target: [] for target in targets}
+        addresses = {target: socket.gethostbyname(target) for target in targets}
+        ident = next(self._icmp_ids) & 0xFFFF
+        payload = b'X' * 56
+        pending = {}
+        
+        with socket.socket(socket.AF_INET, self._icmp_type, socket.IPPROTO_ICMP) as sock:
+            for seq, (target, _) in enumerate(
+                    itertools.product(targets, range(count))):
+                seq &= 0xFFFF
+                header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+                checksum = _icmp_checksum(header + payload)
+                header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq)
+                pending[seq] = (target, time.perf_counter())
+                sock.sendto(header + payload, (addresses[target], 0))
+                
+            deadline = time.perf_counter() + timeout
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([sock], [], [], remaining)
+                if not readable:
+                    break
+                
+                packet, addr = sock.recvfrom(2048)
+                received = time.perf_counter()
+                if self._icmp_type == socket.SOCK_RAW:
+                    # Raw sockets see the IP header and every ICMP packet
+                    packet = packet[(packet[0] & 0x0F) * 4:]
+                if len(packet) < 8:
+                    continue
+                icmp_type, _, _, reply_ident, seq = struct.unpack('!BBHHH', packet[:8])
+                if icmp_type != ICMP_ECHO_REPLY or seq not in pending:
+                    continue
+                # The kernel rewrites the identifier on unprivileged sockets
+                if self._icmp_type == socket.SOCK_RAW and reply_ident != ident:
+                    continue
+                target, sent = pending[seq]
+                if addr[0] != addresses[target]:
+                    continue
+                del pending[seq]
+                rtts[target].append((received - sent) * 1000)
+                
+        return rtts
         
     def generate_ping_traffic(self, target: str, count: int = 10):
         """Generate ICMP ping traffic"""
         try:
+            if self._icmp_type is not None:
+                rtts = self._icmp_ping([target], count)[target]
+                self._report_icmp(target, rtts)
+                return
+            
             result = subprocess.run(
-                ['ping', '-c', str(count), target],
+                self._ping_command(target, count),
                 capture_output=True,
-                text=True,
                 timeout=count + 5
             )
-            
-            if result.returncode == 0:
-                # Parse statistics
-                output = result.stdout
-                if 'min/avg/max' in output:
-                    stats_line = output.split('min/avg/max')[1].split('\n')[0]
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                          f"Ping to {target}: {stats_line}")
-            else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                      f"Ping to {target}: FAILED")
+            self._report_ping(target, result.returncode, result.stdout)
                       
         except Exception as e:
             print(f"Error generating ping traffic to {target}: {e}")
             
+    def _report_icmp(self, target: str, rtts: List[float]):
+        """Print the result of an in-process ping run"""
+        if rtts:
+            print(f"[{_ts()}] "
+                  f"Ping to {target}: min/avg/max = {min(rtts):.3f}/"
+                  f"{sum(rtts) / len(rtts):.3f}/{max(rtts):.3f} ms")
+        else:
+            print(f"[{_ts()}] "
+                  f"Ping to {target}: FAILED")
+            
+    @staticmethod
+    def _ping_command(target: str, count: int) -> List[str]:
+        """Build the ping command used for ICMP traffic"""
+        return ['ping', '-c', str(count), target]
+            
+    def _report_ping(self, target: str, returncode: int, output: bytes):
+        """Print the result of a ping run"""
+        if returncode == 0:
+            # Parse statistics
+            match = _PING_STATS_RE.search(output)
+            if match:
+                print(f"[{_ts()}] "
+                      f"Ping to {target}: {match.group(0).decode()}")
+        else:
+            print(f"[{_ts()}] "
+                  f"Ping to {target}: FAILED")
+            
     def generate_http_traffic(self, target: str, port: int = 80):
         """Generate HTTP traffic"""
         try:
             result = subprocess.run(
-                ['curl', '-s', '-o', '/dev/null', '-w', '%{time_total}',
-                 f'http://{target}:{port}'],
+                self._http_command(target, port),
                 capture_output=True,
-                text=True,
                 timeout=10
             )
-            
-            if result.returncode == 0:
-                response_time = float(result.stdout) * 1000  # Convert to ms
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                      f"HTTP to {target}:{port}: {response_time:.2f} ms")
-            else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                      f"HTTP to {target}:{port}: FAILED")
+            self._report_http(target, port, result.returncode, result.stdout)
                       
         except Exception as e:
             print(f"Error generating HTTP traffic to {target}:{port}: {e}")
             
+    @staticmethod
+    def _http_command(target: str, port: int) -> List[str]:
+        """Build the curl command used for HTTP traffic"""
+        return ['curl', '-s', '-o', '/dev/null', '-w', '%{time_total}',
+                f'http://{target}:{port}']
+            
+    def _report_http(self, target: str, port: int, returncode: int, output: bytes):
+        """Print the result of a curl run"""
+        if returncode == 0:
+            response_time = float(output) * 1000  # Convert to ms
+            print(f"[{_ts()}] "
+                  f"HTTP to {target}:{port}: {response_time:.2f} ms")
+        else:
+            print(f"[{_ts()}] "
+                  f"HTTP to {target}:{port}: FAILED")
+            
     def generate_udp_traffic(self, target: str, port: int = 5000, size: int = 1024):
         """Generate UDP traffic"""
         try:
-            # Use netcat or similar tool
-            data = 'X' * size
-            result = subprocess.run(
-                ['echo', data, '|', 'nc', '-u', '-w', '1', target, str(port)],
-                shell=True,
-                capture_output=True,
-                timeout=5
-            )
+            self._udp_sock.sendto(b'X' * size, (target, port))
             
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+            print(f"[{_ts()}] "
                   f"UDP to {target}:{port}: {size} bytes sent")
                   
         except Exception as e:
@@ -111,40 +259,101 @@ class TrafficGenerator:
                     lines = output.split('\n')
                     for line in lines:
                         if 'Mbits/sec' in line:
-                            print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                            print(f"[{_ts()}] "
                                   f"TCP to {target}:{port}: {line.strip()}")
                             break
             else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                print(f"[{_ts()}] "
                       f"TCP to {target}:{port}: FAILED")
                       
         except Exception as e:
             print(f"Error generating TCP traffic to {target}:{port}: {e}")
             
-    def generate_mixed_traffic(self):
-        """Generate mixed traffic patterns"""
-        print(f"\n{'='*60}")
-        print(f"Starting mixed traffic generation at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*60}\n")
+    async def _run_probe(self, command: List[str], timeout: float):
+        """
+        Run a traffic command without blocking the event loop
+        
+        Returns:
+            Tuple of (returncode, raw stdout bytes)
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            proc.kill()
+            raise
+        return proc.returncode, stdout
+        
+    def _refill_schedule(self):
+        """Pre-draw the random choices for the next batch of mixed probes"""
+        rng = self._rng
+        self._schedule_targets = rng.choices(self.targets, k=SCHEDULE_SIZE)
+        self._schedule_types = rng.choices(TRAFFIC_TYPES, k=SCHEDULE_SIZE)
+        self._schedule_http_ports = rng.choices(range(8001, 8007), k=SCHEDULE_SIZE)
+        self._schedule_udp_ports = rng.choices(range(5000, 5011), k=SCHEDULE_SIZE)
+        self._schedule_sizes = rng.choices(range(512, 2049), k=SCHEDULE_SIZE)
+        self._schedule_delays = [rng.uniform(1, 5) for _ in range(SCHEDULE_SIZE)]
+        self._schedule_pos = 0
+        
+    def _next_probe(self) -> Tuple[str, str, int, int, int, float]:
+        """
+        Take the next mixed probe from the pre-drawn schedule
+        
+        Returns:
+            Tuple of (target, traffic_type, http_port, udp_port, size, delay)
+        """
+        if self._schedule_pos >= SCHEDULE_SIZE:
+            self._refill_schedule()
+        i = self._schedule_pos
+        self._schedule_pos += 1
+        return (self._schedule_targets[i], self._schedule_types[i],
+                self._schedule_http_ports[i], self._schedule_udp_ports[i],
+                self._schedule_sizes[i], self._schedule_delays[i])
+        
+    async def _mixed_traffic_worker(self):
+        """Repeatedly send one randomly chosen probe to a random target"""
+        loop = asyncio.get_running_loop()
         
         while self.running:
             # Randomly select traffic type and target
-            target = random.choice(self.targets)
-            traffic_type = random.choice(['ping', 'http', 'udp'])
-            
-            if traffic_type == 'ping':
-                self.generate_ping_traffic(target, count=5)
-            elif traffic_type == 'http':
-                port = random.randint(8001, 8006)
-                self.generate_http_traffic(target, port)
-            elif traffic_type == 'udp':
-                port = random.randint(5000, 5010)
-                size = random.randint(512, 2048)
-                self.generate_udp_traffic(target, port, size)
+            target, traffic_type, http_port, udp_port, size, delay = self._next_probe()
+            
+            try:
+                if traffic_type == 'ping' and self._icmp_type is not None:
+                    await loop.run_in_executor(
+                        None, self.generate_ping_traffic, target, 5)
+                elif traffic_type == 'ping':
+                    returncode, output = await self._run_probe(
+                        self._ping_command(target, 5), timeout=10)
+                    self._report_ping(target, returncode, output)
+                elif traffic_type == 'http':
+                    returncode, output = await self._run_probe(
+                        self._http_command(target, http_port), timeout=10)
+                    self._report_http(target, http_port, returncode, output)
+                elif traffic_type == 'udp':
+                    self.generate_udp_traffic(target, udp_port, size)
+            except Exception as e:
+                print(f"Error generating {traffic_type} traffic to {target}: {e}")
                 
             # Random delay between traffic bursts
-            delay = random.uniform(1, 5)
-            time.sleep(delay)
+            await asyncio.sleep(delay)
+            
+    async def generate_mixed_traffic(self, concurrency: int = 16):
+        """
+        Generate mixed traffic patterns
+        
+        Args:
+            concurrency: Number of probes kept in flight at the same time
+        """
+        print(f"\n{'='*60}")
+        print(f"Starting mixed traffic generation at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"{'='*60}\n")
+        
+        await asyncio.gather(*(self._mixed_traffic_worker() for _ in range(concurrency)))
             
     def generate_burst_traffic(self, duration: int = 30):
         """Generate burst traffic for stress testing"""
@@ -152,22 +361,34 @@ class TrafficGenerator:
         print(f"Starting burst traffic for {duration} seconds")
         print(f"{'='*60}\n")
         
+        burst_targets = self.targets[:3]  # Use first 3 targets
         start_time = time.time()
-        threads = []
-        
-        while time.time() - start_time < duration:
-            # Create multiple threads for concurrent traffic
-            for target in self.targets[:3]:  # Use first 3 targets
-                t = threading.Thread(target=self.generate_ping_traffic, args=(target, 10))
-                t.start()
-                threads.append(t)
-                
-            # Wait for threads to complete
-            for t in threads:
-                t.join()
-                
-            threads.clear()
-            time.sleep(2)
+        end_time = start_time + duration
+        
+        # Each target runs one round of pings at a time, and a new round
+        # starts no sooner than BURST_ROUND_INTERVAL after the previous one
+        # started, even when in-process ICMP finishes a round at once
+        running = {}
+        next_start = {target: start_time for target in burst_targets}
+        
+        with ThreadPoolExecutor(max_workers=len(burst_targets)) as executor:
+            while time.time() < end_time:
+                # Slow targets no longer hold back fast ones
+                now = time.time()
+                for target in burst_targets:
+                    if target not in running and now >= next_start[target]:
+                        running[target] = executor.submit(self.generate_ping_traffic, target, 10)
+                        next_start[target] = now + BURST_ROUND_INTERVAL
+                        
+                # Sleep until a round finishes or an idle target is due again
+                idle_due = [next_start[t] for t in burst_targets if t not in running]
+                timeout = min(idle_due) if idle_due else end_time
+                timeout = max(0.0, min(timeout, end_time) - time.time())
+                if running:
+                    done, _ = wait(running.values(), timeout=timeout, return_when=FIRST_COMPLETED)
+                    running = {t: f for t, f in running.items() if f not in done}
+                else:
+                    time.sleep(timeout)
             
         print(f"\nBurst traffic completed")
         
@@ -178,24 +399,58 @@ class TrafficGenerator:
         print(f"{'='*60}\n")
         
         for i in range(10):
-            for target in self.targets:
-                self.generate_ping_traffic(target, count=1)
+            if self._icmp_type is not None:
+                # Probe every target in a single pass over one socket
+                try:
+                    rtts = self._icmp_ping(self.targets, count=1)
+                    for target in self.targets:
+                        self._report_icmp(target, rtts[target])
+                except Exception as e:
+                    print(f"Error generating ping traffic: {e}")
+            else:
+                for target in self.targets:
+                    self.generate_ping_traffic(target, count=1)
             time.sleep(5)
             
         print(f"\nLatency test completed")
         
-    def start(self, mode: str = 'mixed'):
+    def start(self, mode: str = 'mixed', processes: int = None):
         """
         Start traffic generation
         
         Args:
             mode: Traffic generation mode ('mixed', 'burst', 'latency')
+            processes: Number of worker processes for mixed mode, each driving
+                its own share of the targets (defaults to one per CPU core)
         """
         self.running = True
+        workers = []
+        
+        # `kill`, supervisors and `docker stop` send SIGTERM; stop the same
+        # way as on Ctrl+C
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
         
         try:
             if mode == 'mixed':
-                self.generate_mixed_traffic()
+                if processes is None:
+                    processes = os.cpu_count() or 1
+                processes = min(processes, len(self.targets))
+                
+                if processes > 1:
+                    # Each worker owns its sockets, executor and RNG, so the
+                    # shards never contend with each other
+                    workers = [
+                        mp.Process(target=_traffic_worker,
+                                   args=(self.targets[i::processes], mode),
+                                   daemon=True)
+                        for i in range(processes)
+                    ]
+                    for worker in workers:
+                        worker.start()
+                    for worker in workers:
+                        worker.join()
+                else:
+                    asyncio.run(self.generate_mixed_traffic())
             elif mode == 'burst':
                 self.generate_burst_traffic()
             elif mode == 'latency':
@@ -206,12 +461,30 @@ class TrafficGenerator:
         except KeyboardInterrupt:
             print("\n\nStopping traffic generation...")
             self.running = False
+        finally:
+            # A signal sent only to this process never reaches the workers,
+            # so stop any still running rather than leaving them orphaned
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join()
             
     def stop(self):
         """Stop traffic generation"""
         self.running = False
 
 
+def _raise_keyboard_interrupt(signum, frame):
+    """Signal handler that turns SIGTERM into the Ctrl+C shutdown path"""
+    raise KeyboardInterrupt
+
+
+def _traffic_worker(targets: List[str], mode: str):
+    """Generate traffic for one shard of targets in a worker process"""
+    TrafficGenerator(targets=targets).start(mode=mode, processes=1)
+
+
 def main():
     """Main function"""
     import argparse
@@ -7,23 +7,48 @@ Provides utilities for instrumenting network applications
 from opentelemetry import trace, metrics
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
 from opentelemetry.sdk.resources import Resource
+from requests.adapters import HTTPAdapter
+from typing import Dict, Tuple
 import os
+import requests
+
+
+# Providers already set up in this process, keyed by
+# (service_name, traces endpoint, metrics endpoint)
+_providers: Dict[Tuple[str, str, str], Tuple[trace.Tracer, metrics.Meter]] = {}
 
 
 def setup_opentelemetry(service_name: str = "network-service"):
     """
-    Setup OpenTelemetry with OTLP exporters
+    Setup OpenTelemetry with OTLP/HTTP exporters
+    
+    The HTTP exporters avoid loading grpcio, which keeps the agent small
+    enough to run on every Mininet host. Repeated calls for the same
+    service and endpoint reuse the existing providers and exporter
+    connections instead of opening new ones.
+    
+    The exporters read the per-signal OTEL_EXPORTER_OTLP_TRACES_ENDPOINT and
+    OTEL_EXPORTER_OTLP_METRICS_ENDPOINT variables (full URLs), not
+    OTEL_EXPORTER_OTLP_ENDPOINT, which points at the collector's gRPC port
+    for network_monitor.py in the same image.
     
     Args:
         service_name: Name of the service being instrumented
     """
-    # Get OTLP endpoint from environment
-    otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+    # Get OTLP/HTTP endpoints from environment
+    traces_endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT",
+                                "http://localhost:4318/v1/traces")
+    metrics_endpoint = os.getenv("OTEL_EXPORTER_OTLP_METRICS_ENDPOINT",
+                                 "http://localhost:4318/v1/metrics")
+    
+    key = (service_name, traces_endpoint, metrics_endpoint)
+    if key in _providers:
+        return _providers[key]
     
     # Create resource with service information
     resource = Resource.create({
@@ -32,25 +57,50 @@ def setup_opentelemetry(service_name: str = "network-service"):
         "deployment.environment": os.getenv("OTEL_DEPLOYMENT_ENV", "development"),
     })
     
+    # One pooled HTTP session shared by the span and metric exporters
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    
     # Setup Tracing
-    trace_exporter = OTLPSpanExporter(endpoint=otlp_endpoint, insecure=True)
+    trace_exporter = OTLPSpanExporter(
+        endpoint=traces_endpoint,
+        session=session
+    )
     trace_provider = TracerProvider(resource=resource)
-    trace_provider.add_span_processor(BatchSpanProcessor(trace_exporter))
-    trace.set_tracer_provider(trace_provider)
+    # Larger queue and batches so bursts are not dropped and each export
+    # request carries more spans
+    trace_provider.add_span_processor(BatchSpanProcessor(
+        trace_exporter,
+        max_queue_size=16384,
+        schedule_delay_millis=2000,
+        max_export_batch_size=2048,
+        export_timeout_millis=10000
+    ))
     
     # Setup Metrics
-    metric_exporter = OTLPMetricExporter(endpoint=otlp_endpoint, insecure=True)
+    metric_exporter = OTLPMetricExporter(
+        endpoint=metrics_endpoint,
+        session=session
+    )
     metric_reader = PeriodicExportingMetricReader(
         metric_exporter,
-        export_interval_millis=10000  # Export every 10 seconds
+        # Export every 10 seconds unless overridden
+        export_interval_millis=int(os.getenv("OTEL_METRIC_EXPORT_INTERVAL", "10000"))
     )
     meter_provider = MeterProvider(resource=resource, metric_readers=[metric_reader])
-    metrics.set_meter_provider(meter_provider)
+    
+    # The global providers can only be set once per process
+    if not _providers:
+        trace.set_tracer_provider(trace_provider)
+        metrics.set_meter_provider(meter_provider)
     
     print(f"OpenTelemetry initialized for service: {service_name}")
-    print(f"OTLP Endpoint: {otlp_endpoint}")
+    print(f"OTLP Endpoints: {traces_endpoint}, {metrics_endpoint}")
     
-    return trace.get_tracer(__name__), metrics.get_meter(__name__)
+    _providers[key] = (trace_provider.get_tracer(__name__), meter_provider.get_meter(__name__))
+    return _providers[key]
 
 
 def create_network_metrics(meter):
@@ -5,29 +5,65 @@ Collects network performance metrics and sends them to OpenTelemetry Collector
 """
 
 import time
-import random
-import socket
+import os
+import signal
+import asyncio
+import collections
+import threading
 import psutil
-import subprocess
-from typing import Dict, List
+from icmplib import async_ping
 from datetime import datetime
 
 from opentelemetry import metrics
 from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.metrics import Counter as OTelCounter, Histogram as OTelHistogram
+from opentelemetry.sdk.metrics.export import AggregationTemporality, PeriodicExportingMetricReader
 from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
 from opentelemetry.sdk.resources import Resource
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from prometheus_client import start_http_server, Gauge, Counter, Histogram
+from prometheus_client import REGISTRY, CollectorRegistry
+
+
+class CachedCollector:
+    """Serve another collector's metrics, re-collecting at most every ttl seconds"""
+    
+    def __init__(self, inner, ttl: float = 5):
+        self._inner = inner
+        self._ttl = ttl
+        self._ts = 0.0
+        self._cached = None
+        self._lock = threading.Lock()
+        
+    def collect(self):
+        # Scrapes are served from the HTTP server's threads, so only one of
+        # them refreshes the cache while the others wait for its result
+        with self._lock:
+            now = time.monotonic()
+            if self._cached is None or now - self._ts >= self._ttl:
+                self._cached = list(self._inner.collect())
+                self._ts = now
+            return self._cached
 
 
 class NetworkMonitor:
     """Monitor network performance using OpenTelemetry"""
     
     def __init__(self, otel_endpoint: str = "http://otel-collector:4317"):
+        # (timestamp, connections) of the last psutil.net_connections() call,
+        # shared by the OpenTelemetry callback and the Prometheus collector
+        self._conn_cache = (0.0, None)
+        
+        # (timestamp, per-NIC counters) of the last psutil.net_io_counters() call
+        self._net_io_cache = (0.0, None)
+        
+        # Labelled Prometheus gauge children per interface name
+        self._label_cache = {}
+        
         # Setup OpenTelemetry
         self.setup_otel(otel_endpoint)
         
@@ -50,7 +86,17 @@ class NetworkMonitor:
         })
         
         # Metrics setup
-        metric_exporter = OTLPMetricExporter(endpoint=endpoint, insecure=True)
+        # Delta temporality and bounded batches keep each export small
+        # instead of resending every cumulative series
+        metric_exporter = OTLPMetricExporter(
+            endpoint=endpoint,
+            insecure=True,
+            preferred_temporality={
+                OTelCounter: AggregationTemporality.DELTA,
+                OTelHistogram: AggregationTemporality.DELTA,
+            },
+            max_export_batch_size=128
+        )
         metric_reader = PeriodicExportingMetricReader(metric_exporter, export_interval_millis=10000)
         meter_provider = MeterProvider(resource=resource, metric_readers=[metric_reader])
         metrics.set_meter_provider(meter_provider)
@@ -86,8 +132,15 @@ class NetworkMonitor:
         
         # Tracing setup
         trace_exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True)
-        trace_provider = TracerProvider(resource=resource)
-        trace_provider.add_span_processor(BatchSpanProcessor(trace_exporter))
+        # Sample 10% of traces and keep export batches small so a single
+        # export never grows past the collector's gRPC message limit
+        trace_provider = TracerProvider(resource=resource, sampler=ParentBasedTraceIdRatio(0.1))
+        trace_provider.add_span_processor(BatchSpanProcessor(
+            trace_exporter,
+            max_export_batch_size=128,
+            schedule_delay_millis=5000,
+            max_queue_size=2048
+        ))
         trace.set_tracer_provider(trace_provider)
         
         self.tracer = trace.get_tracer(__name__)
@@ -124,46 +177,64 @@ class NetworkMonitor:
             ['state']
         )
         
+    def _get_net_io_cached(self, ttl: float = 2):
+        """
+        Return per-NIC I/O counters, re-reading them at most every ttl seconds
+        
+        Args:
+            ttl: Maximum age of the cached counters in seconds
+        """
+        timestamp, net_io = self._net_io_cache
+        if net_io is None or time.monotonic() - timestamp >= ttl:
+            net_io = psutil.net_io_counters(pernic=True, nowrap=True)
+            self._net_io_cache = (time.monotonic(), net_io)
+        return net_io
+        
     def get_bandwidth(self, options):
         """Callback to get bandwidth metrics"""
-        net_io = psutil.net_io_counters()
-        yield metrics.Observation(net_io.bytes_sent, {"direction": "tx"})
-        yield metrics.Observation(net_io.bytes_recv, {"direction": "rx"})
+        net_io = self._get_net_io_cached()
+        yield metrics.Observation(sum(stats.bytes_sent for stats in net_io.values()), {"direction": "tx"})
+        yield metrics.Observation(sum(stats.bytes_recv for stats in net_io.values()), {"direction": "rx"})
+        
+    def _get_connections_cached(self, ttl: float = 15):
+        """
+        Return the host's inet connections, re-reading them at most every ttl seconds
+        
+        Args:
+            ttl: Maximum age of the cached connection list in seconds
+        """
+        timestamp, connections = self._conn_cache
+        if connections is None or time.monotonic() - timestamp >= ttl:
+            connections = psutil.net_connections(kind='inet')
+            self._conn_cache = (time.monotonic(), connections)
+        return connections
         
     def get_connections(self, options):
         """Callback to get connection count"""
-        connections = psutil.net_connections()
+        connections = self._get_connections_cached()
         yield metrics.Observation(len(connections))
         
-    def measure_latency(self, target: str) -> float:
-        """Measure network latency using ping"""
+    async def measure_latency(self, target: str) -> float:
+        """Measure network latency with an in-process ICMP echo"""
         with self.tracer.start_as_current_span("measure_latency") as span:
             span.set_attribute("target", target)
             
             try:
-                # Use ping command
-                result = subprocess.run(
-                    ['ping', '-c', '1', '-W', '2', target],
-                    capture_output=True,
-                    text=True,
-                    timeout=3
-                )
+                # Raw sockets need root; otherwise use unprivileged ping sockets
+                host = await async_ping(target, count=1, timeout=2,
+                                        privileged=os.geteuid() == 0)
                 
-                if result.returncode == 0:
-                    # Parse ping output for latency
-                    output = result.stdout
-                    if 'time=' in output:
-                        latency_str = output.split('time=')[1].split()[0]
-                        latency = float(latency_str)
-                        
-                        # Record to OpenTelemetry
-                        self.latency_histogram.record(latency, {"target": target, "protocol": "icmp"})
-                        
-                        # Record to Prometheus
-                        self.prom_latency.labels(target=target, protocol='icmp').observe(latency)
-                        
-                        span.set_attribute("latency_ms", latency)
-                        return latency
+                if host.is_alive:
+                    latency = host.avg_rtt
+                    
+                    # Record to OpenTelemetry
+                    self.latency_histogram.record(latency, {"target": target, "protocol": "icmp"})
+                    
+                    # Record to Prometheus
+                    self.prom_latency.labels(target=target, protocol='icmp').observe(latency)
+                    
+                    span.set_attribute("latency_ms", latency)
+                    return latency
                 else:
                     # Packet loss
                     self.packet_loss_counter.add(1, {"target": target})
@@ -178,69 +249,81 @@ class NetworkMonitor:
                 
     def collect_network_stats(self):
         """Collect network interface statistics"""
-        with self.tracer.start_as_current_span("collect_network_stats"):
-            net_io = psutil.net_io_counters(pernic=True)
-            
-            for interface, stats in net_io.items():
-                self.prom_bandwidth_tx.labels(interface=interface).set(stats.bytes_sent)
-                self.prom_bandwidth_rx.labels(interface=interface).set(stats.bytes_recv)
+        # Not traced: a sub-millisecond counter read is not worth a span
+        net_io = self._get_net_io_cached()
+        
+        for interface, stats in net_io.items():
+            children = self._label_cache.get(interface)
+            if children is None:
+                children = self._label_cache[interface] = {
+                    'tx': self.prom_bandwidth_tx.labels(interface=interface),
+                    'rx': self.prom_bandwidth_rx.labels(interface=interface),
+                }
+            children['tx'].set(stats.bytes_sent)
+            children['rx'].set(stats.bytes_recv)
                 
     def collect_connection_stats(self):
         """Collect connection statistics"""
         with self.tracer.start_as_current_span("collect_connection_stats"):
-            connections = psutil.net_connections()
+            connections = self._get_connections_cached()
             
             # Count by state
-            state_counts = {}
-            for conn in connections:
-                state = conn.status
-                state_counts[state] = state_counts.get(state, 0) + 1
+            state_counts = collections.Counter(conn.status for conn in connections)
                 
             for state, count in state_counts.items():
                 self.prom_connections.labels(state=state).set(count)
                 
-    def run(self):
+    async def _collect_once(self):
+        """Collect one round of latency, interface and connection metrics"""
+        # Measure latency to all targets in parallel
+        latencies = await asyncio.gather(
+            *(self.measure_latency(target) for target in self.targets)
+        )
+        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for target, latency in zip(self.targets, latencies):
+            if latency > 0:
+                print(f"[{ts}] Latency to {target}: {latency:.2f} ms")
+            else:
+                print(f"[{ts}] Packet loss to {target}")
+        
+        # Collect network statistics
+        self.collect_network_stats()
+        self.collect_connection_stats()
+        
+    async def run(self):
         """Main monitoring loop"""
         print("Starting Network Monitor with OpenTelemetry...")
         print(f"Monitoring targets: {', '.join(self.targets)}")
         
-        # Start Prometheus HTTP server
-        start_http_server(8080)
+        # Start Prometheus HTTP server; scrapes arriving within 5 seconds of
+        # each other share one collection of the default registry
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(CachedCollector(REGISTRY, ttl=5))
+        start_http_server(8080, registry=registry)
         print("Prometheus metrics available at http://localhost:8080/metrics")
         
-        while True:
-            try:
-                # Measure latency to all targets
-                for target in self.targets:
-                    latency = self.measure_latency(target)
-                    if latency > 0:
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                              f"Latency to {target}: {latency:.2f} ms")
-                    else:
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                              f"Packet loss to {target}")
-                
-                # Collect network statistics
-                self.collect_network_stats()
-                self.collect_connection_stats()
-                
+        # Ctrl+C and `docker stop` cancel the loop wherever it is waiting
+        loop = asyncio.get_running_loop()
+        main_task = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, main_task.cancel)
+        
+        try:
+            while True:
+                try:
+                    await self._collect_once()
+                except Exception as e:
+                    print(f"Error in monitoring loop: {e}")
+                    
                 # Wait before next collection
-                time.sleep(10)
-                
-            except KeyboardInterrupt:
-                print("\nStopping Network Monitor...")
-                break
-            except Exception as e:
-                print(f"Error in monitoring loop: {e}")
-                time.sleep(10)
+                await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            print("\nStopping Network Monitor...")
 
 
 if __name__ == "__main__":
-    import os
-    
     # Get OTLP endpoint from environment or use default
     otel_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://otel-collector:4317")
     
     monitor = NetworkMonitor(otel_endpoint)
-    monitor.run()
-
+    asyncio.run(monitor.run())
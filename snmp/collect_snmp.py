@@ -6,10 +6,13 @@ Collects network metrics using SNMP and exposes them for Prometheus
 
 import time
 import os
+import signal
+import asyncio
 from datetime import datetime
-from pysnmp.hlapi import *
+from pysnmp.hlapi.asyncio import *
+from pysnmp.proto.rfc1905 import EndOfMibView
 from prometheus_client import start_http_server, Gauge, Counter, Info
-from typing import Dict, List, Tuple
+from typing import AsyncIterator, Dict, Tuple
 
 print("DEBUG: collect_snmp starting")
 
@@ -38,6 +41,10 @@ class SNMPCollector:
         'ifOutUcastPkts': '1.3.6.1.2.1.2.2.1.17',
         'ifOutErrors': '1.3.6.1.2.1.2.2.1.20',
         
+        # 64-bit octet counters (IF-MIB ifXTable)
+        'ifHCInOctets': '1.3.6.1.2.1.31.1.1.1.6',
+        'ifHCOutOctets': '1.3.6.1.2.1.31.1.1.1.10',
+        
         # IP Statistics
         'ipInReceives': '1.3.6.1.2.1.4.3.0',
         'ipInDelivers': '1.3.6.1.2.1.4.9.0',
@@ -55,18 +62,59 @@ class SNMPCollector:
         'udpOutDatagrams': '1.3.6.1.2.1.7.4.0',
     }
     
+    # Adaptive polling: the interval shrinks while utilization moves by more
+    # than TARGET_UTIL_CHANGE (as a fraction of link speed) between polls and
+    # grows while it stays below, bounded by MIN/MAX_INTERVAL seconds
+    POLL_ALPHA = 0.3
+    TARGET_UTIL_CHANGE = 0.1
+    MIN_INTERVAL = 1.0
+    MAX_INTERVAL = 60.0
+    
+    # Idle interfaces skip the packet/error columns, but still get a full
+    # poll at least every FULL_POLL_EVERY cycles to refresh error counters
+    FULL_POLL_EVERY = 10
+    
+    # From this ifSpeed up the 32-bit octet counters can wrap between polls
+    # (every ~34 s at 1 Gbit/s), so the 64-bit ifHC* counters are used
+    HC_COUNTER_MIN_SPEED = 20_000_000
+    
     def __init__(self, target: str, community: str = 'public', version: str = '2c'):
         self.target = target
         self.community = community
         self.version = version
         
+        # SNMP engine and request parameters, reused for every request
+        self._engine = SnmpEngine()
+        self._community = CommunityData(community)
+        self._ctx = ContextData()
+        self._transport = None
+        
         # Setup Prometheus metrics
         self.setup_prometheus_metrics()
         
-        # Store previous values for rate calculation
-        self.previous_values = {}
+        # Store previous octet counters for rate calculation, keyed by
+        # interface index
+        self.previous_in_octets = {}
+        self.previous_out_octets = {}
         self.previous_time = time.time()
         
+        # Whether the stored octet counters are the 64-bit ifHC* ones, keyed
+        # by interface index
+        self.previous_counter_hc = {}
+        
+        # Last seen ifOperStatus and the cycle of the last full poll, both
+        # keyed by interface index
+        self.previous_oper_status = {}
+        self._last_full_poll = {}
+        self._poll_cycle = 0
+        
+        # Latest utilization percentage per (interface, direction)
+        self.utilization = {}
+        
+        # Labelled gauge children per interface name, so the per-cycle loop
+        # skips the label lookup in every metric
+        self._label_cache = {}
+        
     def setup_prometheus_metrics(self):
         """Setup Prometheus metrics"""
         # System info
@@ -104,7 +152,15 @@ class SNMPCollector:
         self.udp_in_datagrams = Counter('snmp_udp_in_datagrams_total', 'UDP datagrams received')
         self.udp_out_datagrams = Counter('snmp_udp_out_datagrams_total', 'UDP datagrams sent')
         
-    def snmp_get(self, oid: str) -> Tuple[bool, any]:
+    def _transport_target(self) -> UdpTransportTarget:
+        """Return the UDP transport, creating it on first use"""
+        # Resolved lazily so an agent that is not reachable yet does not
+        # stop the collector from starting
+        if self._transport is None:
+            self._transport = UdpTransportTarget((self.target, 161))
+        return self._transport
+        
+    async def snmp_get(self, oid: str) -> Tuple[bool, any]:
         """
         Perform SNMP GET operation
         
@@ -115,16 +171,14 @@ class SNMPCollector:
             Tuple of (success, value)
         """
         try:
-            iterator = getCmd(
-                SnmpEngine(),
-                CommunityData(self.community),
-                UdpTransportTarget((self.target, 161)),
-                ContextData(),
+            errorIndication, errorStatus, errorIndex, varBinds = await getCmd(
+                self._engine,
+                self._community,
+                self._transport_target(),
+                self._ctx,
                 ObjectType(ObjectIdentity(oid))
             )
             
-            errorIndication, errorStatus, errorIndex, varBinds = next(iterator)
-            
             if errorIndication:
                 print(f"SNMP Error: {errorIndication}")
                 return False, None
@@ -139,206 +193,300 @@ class SNMPCollector:
             print(f"Exception during SNMP GET: {e}")
             return False, None
             
-    def snmp_walk(self, oid: str) -> List[Tuple[str, any]]:
+    async def snmp_iter_walk(self, oid: str, max_repetitions: int = 0) -> AsyncIterator[Tuple[any, any]]:
         """
-        Perform SNMP WALK operation
+        Perform SNMP WALK operation, yielding rows as the responses arrive
         
         Args:
             oid: SNMP OID to walk
+            max_repetitions: Rows per GET-BULK request, or 0 to use GETNEXT
             
-        Returns:
-            List of (oid, value) tuples
+        Yields:
+            (oid, value) tuples in walk order; the oid is a pysnmp ObjectName,
+            so callers only pay for str() where they need it
         """
-        results = []
+        prefix = tuple(int(part) for part in oid.split('.'))
+        current = prefix
+        
         try:
-            for (errorIndication, errorStatus, errorIndex, varBinds) in nextCmd(
-                SnmpEngine(),
-                CommunityData(self.community),
-                UdpTransportTarget((self.target, 161)),
-                ContextData(),
-                ObjectType(ObjectIdentity(oid)),
-                lexicographicMode=False
-            ):
+            while True:
+                if max_repetitions:
+                    errorIndication, errorStatus, errorIndex, varBindTable = await bulkCmd(
+                        self._engine,
+                        self._community,
+                        self._transport_target(),
+                        self._ctx,
+                        0, max_repetitions,
+                        ObjectType(ObjectIdentity(current))
+                    )
+                else:
+                    errorIndication, errorStatus, errorIndex, varBindTable = await nextCmd(
+                        self._engine,
+                        self._community,
+                        self._transport_target(),
+                        self._ctx,
+                        ObjectType(ObjectIdentity(current))
+                    )
+                    
                 if errorIndication:
                     print(f"SNMP Error: {errorIndication}")
-                    break
+                    return
                 elif errorStatus:
                     print(f"SNMP Error: {errorStatus.prettyPrint()}")
-                    break
-                else:
-                    for varBind in varBinds:
-                        results.append((str(varBind[0]), varBind[1]))
-                        
+                    return
+                if not varBindTable:
+                    return
+                    
+                for varBinds in varBindTable:
+                    name, value = varBinds[0]
+                    last, current = current, tuple(name.getOid())
+                    # Stop once the walk leaves the requested subtree
+                    if current[:len(prefix)] != prefix or isinstance(value, EndOfMibView):
+                        return
+                    # An agent that repeats or goes back would loop forever
+                    if current <= last:
+                        print(f"SNMP Error: OIDs are not increasing at {name.prettyPrint()}")
+                        return
+                    yield name, value
         except Exception as e:
             print(f"Exception during SNMP WALK: {e}")
             
-        return results
+    async def snmp_bulk_walk(self, oid: str) -> Dict[int, any]:
+        """
+        Walk a table column using GET-BULK requests
+        
+        Args:
+            oid: Column OID to walk
+            
+        Returns:
+            Dictionary mapping row index to value
+        """
+        return {
+            int(name.getOid()[-1]): value
+            async for name, value in self.snmp_iter_walk(oid, max_repetitions=25)
+        }
         
-    def collect_system_info(self):
+    async def collect_system_info(self):
         """Collect system information"""
-        success, sys_descr = self.snmp_get(self.OIDS['sysDescr'])
+        descr, uptime = await asyncio.gather(
+            self.snmp_get(self.OIDS['sysDescr']),
+            self.snmp_get(self.OIDS['sysUpTime'])
+        )
+        
+        success, sys_descr = descr
         if success:
             self.system_info.info({'description': str(sys_descr)})
             
-        success, sys_uptime = self.snmp_get(self.OIDS['sysUpTime'])
+        success, sys_uptime = uptime
         if success:
             # Convert from TimeTicks (hundredths of seconds) to seconds
             uptime_seconds = int(sys_uptime) / 100
             self.system_uptime.set(uptime_seconds)
             
-    def collect_interface_stats(self):
+    def _interface_metrics(self, interface_name: str) -> Dict[str, Gauge]:
+        """
+        Return the labelled gauges for one interface, creating them on first use
+        
+        Args:
+            interface_name: Interface description used as the metric label
+            
+        Returns:
+            Dictionary of labelled gauges keyed by short metric name
+        """
+        children = self._label_cache.get(interface_name)
+        if children is None:
+            children = self._label_cache[interface_name] = {
+                'in_octets': self.if_in_octets.labels(interface=interface_name),
+                'out_octets': self.if_out_octets.labels(interface=interface_name),
+                'in_packets': self.if_in_packets.labels(interface=interface_name),
+                'out_packets': self.if_out_packets.labels(interface=interface_name),
+                'in_errors': self.if_in_errors.labels(interface=interface_name),
+                'out_errors': self.if_out_errors.labels(interface=interface_name),
+                'speed': self.if_speed.labels(interface=interface_name),
+                'status': self.if_status.labels(interface=interface_name),
+                'util_in': self.if_bandwidth_utilization.labels(interface=interface_name, direction='in'),
+                'util_out': self.if_bandwidth_utilization.labels(interface=interface_name, direction='out'),
+            }
+        return children
+        
+    async def collect_interface_stats(self):
         """Collect interface statistics"""
-        # Get number of interfaces
-        success, if_number = self.snmp_get(self.OIDS['ifNumber'])
-        if not success:
+        # Walk each ifTable column once, all in parallel; every walk
+        # returns all interfaces
+        names = ('ifDescr', 'ifInOctets', 'ifOutOctets', 'ifHCInOctets',
+                 'ifHCOutOctets', 'ifSpeed', 'ifOperStatus')
+        walks = await asyncio.gather(*(self.snmp_bulk_walk(self.OIDS[name]) for name in names))
+        columns = dict(zip(names, walks))
+        if not columns['ifDescr']:
             return
             
-        num_interfaces = int(if_number)
         current_time = time.time()
         time_delta = current_time - self.previous_time
+        cycle = self._poll_cycle
+        self._poll_cycle += 1
         
-        for i in range(1, num_interfaces + 1):
-            # Get interface description
-            success, if_descr = self.snmp_get(f"{self.OIDS['ifDescr']}.{i}")
-            if not success:
-                continue
+        # Interfaces whose packet/error counters need fetching this cycle
+        active = []
+        
+        for i, if_descr in columns['ifDescr'].items():
             interface_name = str(if_descr)
+            children = self._interface_metrics(interface_name)
+            if_speed = columns['ifSpeed'].get(i)
+            
+            # Convert the speed once; utilization % = bytes/s * 8 / bps * 100
+            speed_bps = int(if_speed) if if_speed is not None else 0
+            inv_speed = 0.0 if speed_bps == 0 else 800.0 / speed_bps
             
-            # Get interface statistics
-            success, in_octets = self.snmp_get(f"{self.OIDS['ifInOctets']}.{i}")
-            if success:
+            # Get interface statistics, from the 64-bit counters on fast links
+            # that have them
+            in_octets = columns['ifInOctets'].get(i)
+            out_octets = columns['ifOutOctets'].get(i)
+            use_hc = (speed_bps >= self.HC_COUNTER_MIN_SPEED and i in columns['ifHCInOctets']
+                      and i in columns['ifHCOutOctets'])
+            if use_hc:
+                in_octets = columns['ifHCInOctets'][i]
+                out_octets = columns['ifHCOutOctets'][i]
+                
+            # A delta between a 64-bit and a 32-bit reading is meaningless
+            # (e.g. after an ifXTable walk timed out), so skip this cycle's
+            # rate when the counter source changes
+            if self.previous_counter_hc.get(i, use_hc) != use_hc:
+                self.previous_in_octets.pop(i, None)
+                self.previous_out_octets.pop(i, None)
+            self.previous_counter_hc[i] = use_hc
+            prev_in = self.previous_in_octets.get(i)
+            prev_out = self.previous_out_octets.get(i)
+                
+            if in_octets is not None:
                 in_octets_val = int(in_octets)
-                self.if_in_octets.labels(interface=interface_name).set(in_octets_val)
+                children['in_octets'].set(in_octets_val)
                 
                 # Calculate bandwidth utilization
-                if f"in_octets_{i}" in self.previous_values and time_delta > 0:
-                    prev_in_octets = self.previous_values[f"in_octets_{i}"]
+                if i in self.previous_in_octets and time_delta > 0:
+                    prev_in_octets = self.previous_in_octets[i]
                     bytes_per_sec = (in_octets_val - prev_in_octets) / time_delta
                     
-                    # Get interface speed
-                    success, if_speed = self.snmp_get(f"{self.OIDS['ifSpeed']}.{i}")
-                    if success and int(if_speed) > 0:
-                        bits_per_sec = bytes_per_sec * 8
-                        utilization = (bits_per_sec / int(if_speed)) * 100
-                        self.if_bandwidth_utilization.labels(
-                            interface=interface_name, 
-                            direction='in'
-                        ).set(utilization)
+                    if inv_speed:
+                        utilization = bytes_per_sec * inv_speed
+                        children['util_in'].set(utilization)
+                        self.utilization[(interface_name, 'in')] = utilization
                         
-                self.previous_values[f"in_octets_{i}"] = in_octets_val
+                self.previous_in_octets[i] = in_octets_val
                 
-            success, out_octets = self.snmp_get(f"{self.OIDS['ifOutOctets']}.{i}")
-            if success:
+            if out_octets is not None:
                 out_octets_val = int(out_octets)
-                self.if_out_octets.labels(interface=interface_name).set(out_octets_val)
+                children['out_octets'].set(out_octets_val)
                 
                 # Calculate bandwidth utilization
-                if f"out_octets_{i}" in self.previous_values and time_delta > 0:
-                    prev_out_octets = self.previous_values[f"out_octets_{i}"]
+                if i in self.previous_out_octets and time_delta > 0:
+                    prev_out_octets = self.previous_out_octets[i]
                     bytes_per_sec = (out_octets_val - prev_out_octets) / time_delta
                     
-                    success, if_speed = self.snmp_get(f"{self.OIDS['ifSpeed']}.{i}")
-                    if success and int(if_speed) > 0:
-                        bits_per_sec = bytes_per_sec * 8
-                        utilization = (bits_per_sec / int(if_speed)) * 100
-                        self.if_bandwidth_utilization.labels(
-                            interface=interface_name,
-                            direction='out'
-                        ).set(utilization)
+                    if inv_speed:
+                        utilization = bytes_per_sec * inv_speed
+                        children['util_out'].set(utilization)
+                        self.utilization[(interface_name, 'out')] = utilization
                         
-                self.previous_values[f"out_octets_{i}"] = out_octets_val
-                
-            # Other interface metrics
-            success, in_packets = self.snmp_get(f"{self.OIDS['ifInUcastPkts']}.{i}")
-            if success:
-                self.if_in_packets.labels(interface=interface_name).set(int(in_packets))
-                
-            success, out_packets = self.snmp_get(f"{self.OIDS['ifOutUcastPkts']}.{i}")
-            if success:
-                self.if_out_packets.labels(interface=interface_name).set(int(out_packets))
-                
-            success, in_errors = self.snmp_get(f"{self.OIDS['ifInErrors']}.{i}")
-            if success:
-                self.if_in_errors.labels(interface=interface_name).set(int(in_errors))
+                self.previous_out_octets[i] = out_octets_val
                 
-            success, out_errors = self.snmp_get(f"{self.OIDS['ifOutErrors']}.{i}")
-            if success:
-                self.if_out_errors.labels(interface=interface_name).set(int(out_errors))
+            oper_status = columns['ifOperStatus'].get(i)
+            if oper_status is not None:
+                oper_status = int(oper_status)
+                children['status'].set(oper_status)
+            if if_speed is not None:
+                children['speed'].set(speed_bps)
                 
-            success, if_speed = self.snmp_get(f"{self.OIDS['ifSpeed']}.{i}")
-            if success:
-                self.if_speed.labels(interface=interface_name).set(int(if_speed))
-                
-            success, oper_status = self.snmp_get(f"{self.OIDS['ifOperStatus']}.{i}")
-            if success:
-                self.if_status.labels(interface=interface_name).set(int(oper_status))
+            # No traffic and no status change since the last poll: the
+            # packet/error counters cannot have moved either
+            idle = (prev_in is not None and prev_out is not None
+                    and self.previous_in_octets.get(i) == prev_in
+                    and self.previous_out_octets.get(i) == prev_out
+                    and self.previous_oper_status.get(i) == oper_status)
+            self.previous_oper_status[i] = oper_status
+            if not idle or cycle - self._last_full_poll.get(i, cycle - self.FULL_POLL_EVERY) >= self.FULL_POLL_EVERY:
+                active.append((i, children))
                 
         self.previous_time = current_time
+        if not active:
+            return
+            
+        # Other interface metrics, only walked when some interface needs them
+        names = ('ifInUcastPkts', 'ifOutUcastPkts', 'ifInErrors', 'ifOutErrors')
+        keys = ('in_packets', 'out_packets', 'in_errors', 'out_errors')
+        walks = await asyncio.gather(*(self.snmp_bulk_walk(self.OIDS[name]) for name in names))
+        
+        for i, children in active:
+            for column, key in zip(walks, keys):
+                value = column.get(i)
+                if value is not None:
+                    children[key].set(int(value))
+            self._last_full_poll[i] = cycle
 
-    def collect_ip_stats(self):
-        """Collect IP statistics"""
-        success, ip_in_receives = self.snmp_get(self.OIDS['ipInReceives'])
-        if success:
-            # Note: Prometheus Counter doesn't have a set method, we track the value
-            pass
-
-        success, ip_in_delivers = self.snmp_get(self.OIDS['ipInDelivers'])
-        if success:
-            pass
-
-        success, ip_out_requests = self.snmp_get(self.OIDS['ipOutRequests'])
-        if success:
-            pass
-
-    def collect_tcp_stats(self):
+    async def collect_tcp_stats(self):
         """Collect TCP statistics"""
-        success, tcp_curr_estab = self.snmp_get(self.OIDS['tcpCurrEstab'])
+        success, tcp_curr_estab = await self.snmp_get(self.OIDS['tcpCurrEstab'])
         if success:
             self.tcp_curr_estab.set(int(tcp_curr_estab))
 
-    def collect_udp_stats(self):
-        """Collect UDP statistics"""
-        pass  # Similar to TCP stats
-
-    def collect_all(self):
+    async def collect_all(self):
         """Collect all metrics"""
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Collecting SNMP metrics from {self.target}...")
 
         try:
-            self.collect_system_info()
-            self.collect_interface_stats()
-            self.collect_ip_stats()
-            self.collect_tcp_stats()
-            self.collect_udp_stats()
+            # Every stage only waits on the network, so run them together
+            await asyncio.gather(
+                self.collect_system_info(),
+                self.collect_interface_stats(),
+                self.collect_tcp_stats()
+            )
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Collection complete")
         except Exception as e:
             print(f"Error collecting metrics: {e}")
 
-    def run(self, interval: int = 15):
+    async def run(self, interval: float = 15):
         """
         Run the collector continuously
 
         Args:
-            interval: Collection interval in seconds
+            interval: Initial collection interval in seconds; it then adapts
+                to how quickly interface utilization changes
         """
         print(f"Starting SNMP Collector for {self.target}")
         print(f"Community: {self.community}, Version: {self.version}")
-        print(f"Collection interval: {interval} seconds")
+        print(f"Collection interval: {interval} seconds "
+              f"(adaptive, {self.MIN_INTERVAL:g}-{self.MAX_INTERVAL:g}s)")
 
         # Start Prometheus HTTP server
         start_http_server(8000)
         print("Prometheus metrics available at http://localhost:8000/metrics")
 
-        while True:
-            try:
-                self.collect_all()
-                time.sleep(interval)
-            except KeyboardInterrupt:
-                print("\nStopping SNMP Collector...")
-                break
-            except Exception as e:
-                print(f"Error in collection loop: {e}")
-                time.sleep(interval)
+        # Ctrl+C and `docker stop` cancel the loop wherever it is waiting
+        loop = asyncio.get_running_loop()
+        main_task = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, main_task.cancel)
+
+        prev_util = {}
+        try:
+            while True:
+                try:
+                    await self.collect_all()
+
+                    # Poll faster while utilization is moving, slower while stable
+                    util_change = max(
+                        (abs(util - prev_util.get(key, util)) / 100
+                         for key, util in self.utilization.items()),
+                        default=0.0
+                    )
+                    prev_util = dict(self.utilization)
+                    interval *= 1 + self.POLL_ALPHA * (self.TARGET_UTIL_CHANGE - util_change)
+                    interval = min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL)
+                except Exception as e:
+                    print(f"Error in collection loop: {e}")
+
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            print("\nStopping SNMP Collector...")
 
 
 if __name__ == "__main__":
@@ -349,5 +497,4 @@ if __name__ == "__main__":
     interval = int(os.getenv("SNMP_INTERVAL", "15"))
 
     collector = SNMPCollector(target, community, version)
-    collector.run(interval)
-
+    asyncio.run(collector.run(interval))